@@ -1 +1,2 @@
 from .aws_s3_provider import AWSS3Provider
+from .aws_s3_prop_man import S3PropertyManager
@@ -0,0 +1,245 @@
+# (c) 2020 Steve Work; redistribution granted per MIT License
+# (http://github.com/swork/wsgidav/LICENSE)
+
+# Derived from wsgidav, which carries this notice:
+# (c) 2009-2020 Martin Wendt and contributors;
+# see WsgiDAV https://github.com/mar10/wsgidav
+# Original PyFileServer (c) 2005 Ho Chun Wei.
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license.php
+
+"""Implementation of a wsgidav property manager that keeps dead properties in
+the same S3 bucket as the resources they describe, so that every Lambda
+instance serving the bucket sees the same properties.
+
+Properties are kept in one compact JSON "sidecar" object per directory, keyed
+with the directory object key followed by ``/.davprops``. The double slash
+makes the key illegal as a file or directory key (see the specification in
+aws_s3_provider); DirObjectResource.get_member_names relies on that to leave
+sidecars out of collection listings. A sidecar maps member names to their
+properties::
+
+    { "c":  {propname1: value1, propname2: value2},
+      "b/": {propname1: value1},
+      }
+
+A resource's properties live in the sidecar of its parent directory: files
+under their name, subdirectories under their name plus a trailing slash. The
+root directory has no parent, so its properties live in its own sidecar under
+the empty name.
+
+Since a collection and all of its members share at most two sidecars, a
+PROPFIND over a collection is served from two get_object calls rather than one
+S3 request per member. Sidecars are cached for the duration of a single
+request in the WSGI environ; nothing is kept between requests.
+
+Sidecar updates are read-modify-write, made safe against concurrent writers
+(other requests, other Lambda instances) by conditional puts: a sidecar is
+only replaced if its ETag still matches the one read, or only created if it
+still does not exist. A losing writer re-reads and retries a few times before
+giving up with HTTP_CONFLICT. An emptied sidecar is left in place as ``{}``,
+since unconditional deletes would reopen the race; directory deletion sweeps
+it away along with everything else under the directory's key.
+
+Moving a collection together with its members' properties is not supported;
+AWSS3Provider never moves collections.
+"""
+
+import copy
+import json
+
+from botocore.exceptions import ClientError
+from wsgidav import util
+from wsgidav.dav_error import DAVError, HTTP_CONFLICT, HTTP_FORBIDDEN
+
+__docformat__ = "reStructuredText"
+
+_logger = util.get_module_logger(__name__)
+
+SIDECAR_SUFFIX = '/.davprops'
+ENVIRON_CACHE_KEY = 'renlabs.wsgidav.s3_props'
+MAX_WRITE_ATTEMPTS = 4
+
+
+class S3PropertyManager:
+    """Keep dead properties in per-directory sidecar objects in S3.
+
+    Compatible with wsgidav.prop_man.property_manager.PropertyManager. One
+    instance serves a single AWSS3Provider, which supplies the S3 client,
+    bucket and root prefix.
+    """
+    def __init__(self, provider):
+        self.provider = provider
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self.provider!r}>'
+
+    @property
+    def s3Client(self):
+        return self.provider.S3CLIENT
+
+    def _locate(self, norm_url):
+        """Return (sidecar key, member name) holding norm_url's properties"""
+        davPath = self.provider.ref_url_to_path(norm_url)
+        assert davPath[0] == '/'
+        if davPath == '/':
+            return self._sidecar_key('/'), ''
+        parent, name = davPath.rstrip('/').rsplit('/', 1)
+        if davPath[-1] == '/':
+            name += '/'
+        return self._sidecar_key(parent + '/'), name
+
+    def _sidecar_key(self, dir_davPath):
+        assert dir_davPath[-1] == '/'
+        return self.provider.root_prefix + dir_davPath[1:] + SIDECAR_SUFFIX
+
+    def _cache(self, environ):
+        if environ is None:
+            return {}
+        return environ.setdefault(ENVIRON_CACHE_KEY, {})
+
+    def _read_sidecar(self, sidecar_key, environ):
+        """Return (ETag, {name: {propname: value}}) for the sidecar, fetching
+        it from S3 at most once per request. ETag is None if there is no
+        sidecar yet. Callers must not modify the returned dict."""
+        cache = self._cache(environ)
+        if sidecar_key in cache:
+            return cache[sidecar_key]
+        try:
+            response = self.s3Client.get_object(
+                Bucket=self.provider.bucket,
+                Key=sidecar_key)
+            entry = (response['ETag'],
+                     json.loads(response['Body'].read().decode('utf-8')))
+        except self.s3Client.exceptions.NoSuchKey:
+            entry = (None, {})
+        _logger.debug(f'_read_sidecar {sidecar_key!r}: {len(entry[1])} members')
+        cache[sidecar_key] = entry
+        return entry
+
+    def _update_sidecar(self, sidecar_key, update, environ):
+        """Apply update() to a copy of the sidecar and store the result.
+
+        update(sidecar) modifies the dict in place, returning False if there
+        was nothing to change. The put is conditional on the sidecar being
+        unchanged since it was read; if another writer got there first the
+        sidecar is re-read and update() applied again.
+        """
+        if self.provider.readonly:
+            raise DAVError(HTTP_FORBIDDEN)
+        cache = self._cache(environ)
+        for _attempt in range(MAX_WRITE_ATTEMPTS):
+            etag, current = self._read_sidecar(sidecar_key, environ)
+            sidecar = copy.deepcopy(current)
+            if update(sidecar) is False:
+                return
+            kwargs = {
+                'Bucket': self.provider.bucket,
+                'Key': sidecar_key,
+                'Body': json.dumps(sidecar, sort_keys=True).encode('utf-8'),
+                'ContentType': 'application/json'}
+            if etag is None:
+                kwargs['IfNoneMatch'] = '*'
+            else:
+                kwargs['IfMatch'] = etag
+            try:
+                response = self.s3Client.put_object(**kwargs)
+            except ClientError as e:
+                code = e.response.get('Error', {}).get('Code')
+                if code not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                    raise
+                _logger.info(f'_update_sidecar {sidecar_key!r} lost a race ({code}), retrying')
+                cache.pop(sidecar_key, None)
+                continue
+            cache[sidecar_key] = (response['ETag'], sidecar)
+            _logger.debug(f'_update_sidecar {sidecar_key!r}: {len(sidecar)} members')
+            return
+        raise DAVError(HTTP_CONFLICT,
+                       f'Concurrent property updates in {sidecar_key!r}')
+
+    def get_properties(self, norm_url, environ=None):
+        _logger.debug(f'get_properties({norm_url})')
+        sidecar_key, member = self._locate(norm_url)
+        _etag, sidecar = self._read_sidecar(sidecar_key, environ)
+        return list(sidecar.get(member, {}))
+
+    def get_property(self, norm_url, name, environ=None):
+        _logger.debug(f'get_property({norm_url}, {name})')
+        sidecar_key, member = self._locate(norm_url)
+        _etag, sidecar = self._read_sidecar(sidecar_key, environ)
+        return sidecar.get(member, {}).get(name)
+
+    def write_property(self, norm_url, name, property_value, dry_run=False,
+                       environ=None):
+        assert norm_url and norm_url.startswith('/')
+        assert name
+        assert property_value is not None
+        _logger.debug(f'write_property({norm_url}, {name}, dry_run={dry_run})')
+        if self.provider.readonly:
+            raise DAVError(HTTP_FORBIDDEN)
+        if dry_run:
+            return
+        if isinstance(property_value, bytes):
+            property_value = property_value.decode('utf-8')
+        sidecar_key, member = self._locate(norm_url)
+
+        def update(sidecar):
+            sidecar.setdefault(member, {})[name] = property_value
+        self._update_sidecar(sidecar_key, update, environ)
+
+    def remove_property(self, norm_url, name, dry_run=False, environ=None):
+        """Specifying the removal of a property that does not exist is NOT an
+        error."""
+        _logger.debug(f'remove_property({norm_url}, {name}, dry_run={dry_run})')
+        if self.provider.readonly:
+            raise DAVError(HTTP_FORBIDDEN)
+        if dry_run:
+            return
+        sidecar_key, member = self._locate(norm_url)
+
+        def update(sidecar):
+            props = sidecar.get(member, {})
+            if name not in props:
+                return False
+            del props[name]
+            if not props:
+                del sidecar[member]
+        self._update_sidecar(sidecar_key, update, environ)
+
+    def remove_properties(self, norm_url, environ=None):
+        """Remove norm_url's own properties.
+
+        For a collection this leaves its members' properties alone: they live
+        in the collection's own sidecar, which DirObjectResource.delete
+        removes together with the members themselves.
+        """
+        _logger.debug(f'remove_properties({norm_url})')
+        sidecar_key, member = self._locate(norm_url)
+        _etag, sidecar = self._read_sidecar(sidecar_key, environ)
+        if member not in sidecar:
+            return
+
+        def update(sidecar):
+            if sidecar.pop(member, None) is None:
+                return False
+        self._update_sidecar(sidecar_key, update, environ)
+
+    def copy_properties(self, src_url, dest_url, environ=None):
+        _logger.debug(f'copy_properties({src_url}, {dest_url})')
+        src_key, src_member = self._locate(src_url)
+        _etag, src = self._read_sidecar(src_key, environ)
+        props = src.get(src_member)
+        if props is None:
+            return
+        dest_key, dest_member = self._locate(dest_url)
+
+        def update(sidecar):
+            sidecar[dest_member] = copy.deepcopy(props)
+        self._update_sidecar(dest_key, update, environ)
+
+    def move_properties(self, src_url, dest_url, with_children, environ=None):
+        _logger.debug(f'move_properties({src_url}, {dest_url}, {with_children})')
+        assert not (with_children and src_url.endswith('/')), \
+            'moving collections with their members is not supported'
+        self.copy_properties(src_url, dest_url, environ)
+        self.remove_properties(src_url, environ)
@@ -62,7 +62,12 @@ suffers.
    - No file object is allowed to exist whose key is the same as a directory
      object key save the trailing slash.
 
-3. Metadata TODO
+3. Dead properties (PROPPATCH) are kept in the bucket when the provider is
+   configured with ``dead_props=True``; see aws_s3_prop_man. Each directory
+   may be accompanied by a sidecar object keyed with the directory key plus
+   ``/.davprops``, which holds the properties of the directory's members. The
+   double slash keeps these keys clear of the file and directory namespace;
+   directory enumeration skips them explicitly.
 
 4. Locking specialization (required?) TODO
 
@@ -72,6 +77,9 @@ SPECIFICATION. ()It does NOT provide general access to an existing S3 bucket.)
 
 If ``readonly=True`` is passed, write attempts will raise HTTP_FORBIDDEN.
 
+If ``dead_props=True`` is passed, the provider uses an S3PropertyManager in
+place of any property_manager configured for the wsgidav app.
+
 """
 
 import os
@@ -87,12 +95,25 @@ from wsgidav.dav_error import (
     DAVError, HTTP_FORBIDDEN, HTTP_NOT_FOUND, HTTP_METHOD_NOT_ALLOWED)
 from wsgidav.dav_provider import DAVCollection, DAVNonCollection, DAVProvider
 
+from .aws_s3_prop_man import S3PropertyManager
+
 __docformat__ = "reStructuredText"
 
 _logger = util.get_module_logger(__name__)
 
 BUFFER_SIZE = 8192
 
+
+def isMemberName(name):
+    """True if a key, relative to its directory's key, names a direct member.
+
+    Only a trailing slash (marking a subdirectory) is allowed. That rejects
+    the directory key itself, keys further down the hierarchy, and the
+    directory's own dead-property sidecar (see aws_s3_prop_man), whose name
+    relative to the directory starts with a slash.
+    """
+    return name != '' and '/' not in name[:-1]
+
 class FileContentGatherer(io.BytesIO):
     """Override io.BytesIO.close(), deferring to __del__
 
@@ -268,38 +289,38 @@ class FileObjectResource(DAVNonCollection):
             Bucket=self.provider.bucket,
             Key=self.provider.root_prefix + self.davPath[1:])
         _logger.info(f'delete:{self.davPath!r} response:{response!r}')
+        self.remove_all_properties(True)
 
     def copy_move_single(self, dest_davPath, is_move):
         """See DAVResource.copy_move_single() """
         if self.provider.readonly:
             raise DAVError(HTTP_FORBIDDEN)
         assert dest_davPath[0] == '/'
-        assert not dest_davPath[-1] != '/'
+        assert dest_davPath[-1] != '/'
         assert not util.is_equal_or_child_uri(self.davPath, dest_davPath)
         self.s3Client.copy_object(
             Bucket=self.provider.bucket,
-            CopySource=self.provider.root_prefix + self.davPath[1:],
+            CopySource={
+                'Bucket': self.provider.bucket,
+                'Key': self.provider.root_prefix + self.davPath[1:]},
             Key=self.provider.root_prefix + dest_davPath[1:])
+        # Copy dead properties
+        propMan = self.provider.prop_manager
+        if propMan:
+            destRes = self.provider.get_resource_inst(dest_davPath, self.environ)
+            if is_move:
+                propMan.move_properties(
+                    self.get_ref_url(),
+                    destRes.get_ref_url(),
+                    with_children=False,
+                    environ=self.environ,
+                )
+            else:
+                propMan.copy_properties(
+                    self.get_ref_url(), destRes.get_ref_url(), self.environ
+                )
         if is_move:
             self.delete()
-        # # Copy file (overwrite, if exists)
-        # shutil.copy2(self._file_path, fpDest)
-        # # (Live properties are copied by copy2 or copystat)
-        # # Copy dead properties
-        # propMan = self.provider.prop_manager
-        # if propMan:
-        #     destRes = self.provider.get_resource_inst(dest_path, self.environ)
-        #     if is_move:
-        #         propMan.move_properties(
-        #             self.get_ref_url(),
-        #             destRes.get_ref_url(),
-        #             with_children=False,
-        #             environ=self.environ,
-        #         )
-        #     else:
-        #         propMan.copy_properties(
-        #             self.get_ref_url(), destRes.get_ref_url(), self.environ
-        #         )
 
     def support_recursive_move(self, dest_path):
         """Return True, if move_recursive() is available (see comments there)."""
@@ -407,14 +428,14 @@ class DirObjectResource(DAVCollection):
             Prefix=start)
         _logger.debug(f'get_member_names in {self.davPath} start:{start} response:{response!r}')
         nameList.extend(
-            filter(lambda x: x.count('/') <= 1,
+            filter(isMemberName,
                    map(lambda x: x['Key'][startLen:],
                        response.get('Contents', []))))
         while response.get('IsTruncated'):
             response = self.s3Client.list_objects_v2(
                 ContinuationToken=response['NextContinuationToken'])
             nameList.extend(
-                filter(lambda x: x.count('/') <= 1,
+                filter(isMemberName,
                        map(lambda x: x['Key'][startLen:],
                            response.get('Contents', []))))
         return nameList
@@ -486,6 +507,7 @@ class DirObjectResource(DAVCollection):
         if self.provider.readonly:
             raise DAVError(HTTP_FORBIDDEN)
         _logger.debug(f'{self.__class__.__name__}.delete {self.davPath!r}')
+        self.remove_all_properties(True)
         k = self.provider.root_prefix + self.davPath[1:]
         try:
             response = self.s3Client.list_objects_v2(
@@ -596,7 +618,7 @@ class AWSS3Provider(DAVProvider):
         assert self.ROOT_LISTING is not None
         return self.ROOT_PREFIX
 
-    def __init__(self, bucket, root_prefix='', readonly=False):
+    def __init__(self, bucket, root_prefix='', readonly=False, dead_props=False):
         if self.ROOT_PREFIX is None:
             self.retrieveRoot(bucket, root_prefix)
         else:
@@ -605,7 +627,10 @@ class AWSS3Provider(DAVProvider):
                               + f' must not change'
                               + f'({root_prefix!r} vs {self._root_prefix!r})')
         self.readonly = readonly
+        self.dead_props = dead_props
         super(AWSS3Provider, self).__init__()
+        if dead_props:
+            self.set_prop_manager(None)
 
     def __repr__(self):
         rw = "Read-Write"
@@ -617,6 +642,18 @@ class AWSS3Provider(DAVProvider):
     def is_readonly(self):
         return self.readonly
 
+    def set_prop_manager(self, prop_manager):
+        """Substitute an S3PropertyManager when configured with dead_props
+
+        wsgidav hands every provider the app-wide property_manager, which
+        keeps state local to one process.
+        """
+        if self.dead_props:
+            if not isinstance(self.prop_manager, S3PropertyManager):
+                self.prop_manager = S3PropertyManager(self)
+            return
+        super(AWSS3Provider, self).set_prop_manager(prop_manager)
+
     def get_resource_inst(self, davPath, environ):
         """Return ...Resource obj for davPath.
         See DAVProvider.get_resource_inst()
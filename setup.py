@@ -11,6 +11,6 @@ setup(
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License"
     ],
-    install_requires=['wsgidav', 'boto3'],
+    install_requires=['wsgidav', 'boto3>=1.36'],
     zip_safe=True,
 )
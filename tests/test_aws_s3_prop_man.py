@@ -0,0 +1,279 @@
+"""Tests for S3PropertyManager and its use by AWSS3Provider, run against an
+in-memory stand-in for the boto3 S3 client."""
+
+import datetime
+import hashlib
+import io
+import json
+import sys
+import wsgiref.util
+from xml.etree import ElementTree
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from wsgidav.dav_error import DAVError
+from wsgidav.wsgidav_app import WsgiDAVApp
+
+from renlabs.wsgidav import AWSS3Provider, S3PropertyManager
+from renlabs.wsgidav import aws_s3_provider
+
+BUCKET = 'dav.example.org'
+ROOT = 'davroot/'
+PROP = '{urn:test:}color'
+
+
+class FakeS3Client:
+    """Just enough of the S3 API, with a log of the calls made"""
+
+    class exceptions:
+        class NoSuchKey(ClientError):
+            pass
+
+    def __init__(self):
+        self.objects = {}  # key -> bytes
+        self.calls = []
+        self.fail_next_put = None  # error code to raise once from put_object
+
+    @staticmethod
+    def _etag(body):
+        return '"' + hashlib.md5(body).hexdigest() + '"'
+
+    def _item(self, key):
+        return {
+            'Key': key,
+            'Size': len(self.objects[key]),
+            'ETag': self._etag(self.objects[key]),
+            'LastModified': datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)}
+
+    def list_objects_v2(self, Bucket, Prefix='', StartAfter='', MaxKeys=1000,
+                        ContinuationToken=None):
+        self.calls.append(('list_objects_v2', Prefix))
+        keys = sorted(k for k in self.objects
+                      if k.startswith(Prefix) and k > StartAfter)
+        response = {'IsTruncated': False, 'KeyCount': min(len(keys), MaxKeys)}
+        if keys:
+            response['Contents'] = [self._item(k) for k in keys[:MaxKeys]]
+        return response
+
+    def get_object(self, Bucket, Key):
+        self.calls.append(('get_object', Key))
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey(
+                {'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        body = self.objects[Key]
+        return {'Body': io.BytesIO(body), 'ETag': self._etag(body)}
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None,
+                   **kwargs):
+        self.calls.append(('put_object', Key))
+        if self.fail_next_put:
+            code, self.fail_next_put = self.fail_next_put, None
+            raise ClientError({'Error': {'Code': code}}, 'PutObject')
+        if IfNoneMatch == '*' and Key in self.objects:
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, 'PutObject')
+        if IfMatch is not None and (
+                Key not in self.objects
+                or self._etag(self.objects[Key]) != IfMatch):
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, 'PutObject')
+        self.objects[Key] = Body
+        return {'ETag': self._etag(Body)}
+
+    def copy_object(self, Bucket, CopySource, Key):
+        self.calls.append(('copy_object', Key))
+        self.objects[Key] = self.objects[CopySource['Key']]
+
+    def delete_object(self, Bucket, Key):
+        self.calls.append(('delete_object', Key))
+        self.objects.pop(Key, None)
+
+    def sidecar(self, key):
+        return json.loads(self.objects[key].decode('utf-8'))
+
+    def count(self, operation):
+        return sum(1 for call in self.calls if call[0] == operation)
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    client = FakeS3Client()
+    monkeypatch.setattr(boto3, 'client', lambda *args, **kwargs: client)
+    for name in ('S3CLIENT', 'ROOT_PREFIX', 'BUCKET', 'ROOT_LISTING'):
+        monkeypatch.setattr(AWSS3Provider, name, None)
+    monkeypatch.setattr(aws_s3_provider.FileObjectResource, '_s3Client', None)
+    monkeypatch.setattr(aws_s3_provider.DirObjectResource, '_s3Client', None)
+    for key in ('', 'a/', 'a/b/', 'a/c', 'a/d'):
+        client.objects[ROOT + key] = b''
+    return client
+
+
+@pytest.fixture
+def provider(s3):
+    provider = AWSS3Provider(bucket=BUCKET, root_prefix=ROOT, dead_props=True)
+    provider.set_share_path('/')
+    return provider
+
+
+@pytest.fixture
+def environ(provider):
+    return {'wsgidav.provider': provider}
+
+
+@pytest.fixture
+def pm(provider):
+    assert isinstance(provider.prop_manager, S3PropertyManager)
+    return provider.prop_manager
+
+
+def dav_request(app, method, path, body=b'', **headers):
+    environ = {}
+    wsgiref.util.setup_testing_defaults(environ)
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'CONTENT_LENGTH': str(len(body)),
+        'CONTENT_TYPE': 'application/xml',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr})
+    for name, value in headers.items():
+        environ['HTTP_' + name.upper()] = value
+    status = []
+    response = b''.join(app(environ, lambda s, h, e=None: status.append(s)))
+    return int(status[0].split()[0]), response
+
+
+def test_prop_manager_replaces_app_wide_manager(provider, pm):
+    provider.set_prop_manager(object())
+    assert provider.prop_manager is pm
+
+
+@pytest.mark.parametrize('url, sidecar, member', [
+    ('/', ROOT + '/.davprops', ''),
+    ('/a/', ROOT + '/.davprops', 'a/'),
+    ('/a/c', ROOT + 'a//.davprops', 'c'),
+    ('/a/b/', ROOT + 'a//.davprops', 'b/'),
+])
+def test_write_read_remove(s3, pm, url, sidecar, member):
+    pm.write_property(url, PROP, b'<color>red</color>', environ={})
+    assert s3.sidecar(sidecar) == {member: {PROP: '<color>red</color>'}}
+
+    assert pm.get_properties(url, {}) == [PROP]
+    assert pm.get_property(url, PROP, {}) == '<color>red</color>'
+    assert pm.get_property(url, '{urn:test:}other', {}) is None
+
+    pm.remove_property(url, PROP, environ={})
+    assert s3.sidecar(sidecar) == {}
+    assert pm.get_properties(url, {}) == []
+
+
+def test_dry_run_writes_nothing(s3, pm):
+    pm.write_property('/a/c', PROP, b'<color/>', dry_run=True, environ={})
+    assert s3.count('put_object') == 0
+
+
+def test_readonly_refuses_writes(s3, pm, provider):
+    provider.readonly = True
+    with pytest.raises(DAVError):
+        pm.write_property('/a/c', PROP, b'<color/>', environ={})
+
+
+def test_concurrent_writer_is_not_overwritten(s3, pm):
+    environ = {}
+    pm.write_property('/a/c', PROP, b'<color>red</color>', environ=environ)
+    # Another instance updates a different member in the same sidecar
+    pm.write_property('/a/d', PROP, b'<color>blue</color>', environ={})
+    pm.write_property('/a/b/', PROP, b'<color>green</color>', environ=environ)
+    assert set(s3.sidecar(ROOT + 'a//.davprops')) == {'b/', 'c', 'd'}
+    assert pm.get_property('/a/d', PROP, environ) == '<color>blue</color>'
+
+
+def test_concurrent_creator_is_not_overwritten(s3, pm):
+    environ = {}
+    assert pm.get_properties('/a/c', environ) == []
+    pm.write_property('/a/d', PROP, b'<color>blue</color>', environ={})
+    pm.write_property('/a/c', PROP, b'<color>red</color>', environ=environ)
+    assert set(s3.sidecar(ROOT + 'a//.davprops')) == {'c', 'd'}
+
+
+def test_persistent_conflict_raises(s3, pm, monkeypatch):
+    put_object = s3.put_object
+    rivals = iter(range(100))
+
+    def always_stale(**kwargs):
+        # Someone else always wins the race
+        s3.objects[kwargs['Key']] = json.dumps({'x': next(rivals)}).encode()
+        return put_object(**kwargs)
+    monkeypatch.setattr(s3, 'put_object', always_stale)
+    with pytest.raises(DAVError) as excinfo:
+        pm.write_property('/a/c', PROP, b'<color/>', environ={})
+    assert excinfo.value.value == 409
+
+
+def test_failed_write_leaves_cache_unchanged(s3, pm):
+    environ = {}
+    pm.write_property('/a/c', PROP, b'<color>red</color>', environ=environ)
+    s3.fail_next_put = 'InternalError'
+    with pytest.raises(ClientError):
+        pm.write_property('/a/c', PROP, b'<color>blue</color>', environ=environ)
+    assert pm.get_property('/a/c', PROP, environ) == '<color>red</color>'
+
+
+def test_propfind_depth_1_batches_and_hides_sidecars(s3, provider):
+    app = WsgiDAVApp({
+        'provider_mapping': {'/': provider},
+        'simple_dc': {'user_mapping': {'*': True}},
+        'verbose': 1})
+    proppatch = (
+        '<?xml version="1.0"?>'
+        '<D:propertyupdate xmlns:D="DAV:" xmlns:T="urn:test:">'
+        '<D:set><D:prop><T:color>{}</T:color></D:prop></D:set>'
+        '</D:propertyupdate>')
+    for path in ('/a/', '/a/b/', '/a/c'):
+        status, _ = dav_request(app, 'PROPPATCH', path,
+                                proppatch.format(path).encode('utf-8'))
+        assert status == 207
+    assert ROOT + 'a//.davprops' in s3.objects
+
+    s3.calls.clear()
+    status, body = dav_request(app, 'PROPFIND', '/a/', depth='1')
+    assert status == 207
+    assert s3.count('get_object') <= 2
+
+    ns = {'D': 'DAV:', 'T': 'urn:test:'}
+    responses = ElementTree.fromstring(body).findall('D:response', ns)
+    colors = {r.findtext('D:href', namespaces=ns):
+              r.findtext('.//T:color', namespaces=ns) for r in responses}
+    assert colors == {'/a/': '/a/', '/a/b/': '/a/b/', '/a/c': '/a/c', '/a/d': None}
+
+
+def test_copy_carries_properties(s3, pm, provider, environ):
+    pm.write_property('/a/c', PROP, b'<color>red</color>', environ={})
+    res = provider.get_resource_inst('/a/c', environ)
+    res.copy_move_single('/a/b/e', is_move=False)
+    assert s3.objects[ROOT + 'a/b/e'] == b''
+    assert pm.get_property('/a/c', PROP, {}) == '<color>red</color>'
+    assert pm.get_property('/a/b/e', PROP, {}) == '<color>red</color>'
+
+
+def test_move_carries_properties(s3, pm, provider, environ):
+    pm.write_property('/a/c', PROP, b'<color>red</color>', environ={})
+    res = provider.get_resource_inst('/a/c', environ)
+    res.copy_move_single('/e', is_move=True)
+    assert ROOT + 'a/c' not in s3.objects
+    assert pm.get_properties('/a/c', {}) == []
+    assert pm.get_property('/e', PROP, {}) == '<color>red</color>'
+
+
+def test_file_delete_removes_properties(s3, pm, provider, environ):
+    pm.write_property('/a/c', PROP, b'<color>red</color>', environ={})
+    pm.write_property('/a/d', PROP, b'<color>blue</color>', environ={})
+    provider.get_resource_inst('/a/c', environ).delete()
+    assert s3.sidecar(ROOT + 'a//.davprops') == {'d': {PROP: '<color>blue</color>'}}
+
+
+def test_dir_delete_removes_properties(s3, pm, provider, environ):
+    pm.write_property('/a/', PROP, b'<color>red</color>', environ={})
+    pm.write_property('/a/c', PROP, b'<color>blue</color>', environ={})
+    provider.get_resource_inst('/a/', environ).delete()
+    assert not [k for k in s3.objects if k.startswith(ROOT + 'a/')]
+    assert s3.sidecar(ROOT + '/.davprops') == {}